@@ -1,7 +1,7 @@
 from typing import Literal, Optional
 
 from nonebot import get_plugin_config
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, model_validator
 
 
 class Config(BaseModel):
@@ -19,8 +19,8 @@ class Config(BaseModel):
     """最小表情包数量，保存的表情包达到这个数值才发送"""
     meme_llm_max_query: int = 50
     """当启用 LLM 查询时，最大的查询数量"""
-    meme_general_max_query: int = max_memes
-    """全局最大查询数量"""
+    meme_general_max_query: Optional[int] = None
+    """全局最大查询数量，不配置时与 max_memes 保持一致"""
     meme_security_check: bool = True
     """启用基于 LLM 的安全检查"""
     meme_multimodal_config: Optional[str] = None
@@ -35,15 +35,20 @@ class Config(BaseModel):
     meme_embedding_cache_enabled: bool = True
     """启用嵌入缓存"""
 
-    @field_validator("meme_embedding_service_api_key")
-    @classmethod
-    def check_api_key(cls, v: Optional[str]) -> Optional[str]:
-        if cls.meme_similarity_method != "cosine" or v:
-            return v
+    @model_validator(mode="after")
+    def check_config(self) -> "Config":
+        if (
+            self.meme_similarity_method == "cosine"
+            and not self.meme_embedding_service_api_key
+        ):
+            raise ValueError(
+                "启用 cosine 相似度计算时，需要配置 `meme_embedding_service_api_key` !"
+            )
 
-        raise ValueError(
-            "启用 cosine 相似度计算时，需要配置 `meme_embedding_service_api_key` !"
-        )
+        if self.meme_general_max_query is None:
+            self.meme_general_max_query = self.max_memes
+
+        return self
 
 
 config = get_plugin_config(Config)
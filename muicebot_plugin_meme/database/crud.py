@@ -1,83 +1,135 @@
-import json
-from pathlib import Path
-from typing import Optional, Union
-
-from nonebot_plugin_orm import async_scoped_session
-from sqlalchemy import func, select, update
-from sqlalchemy.ext.asyncio import AsyncSession
-
-from ..models import Meme
-from .orm_models import MemeORM
-
-
-class MemeRepository:
-    @staticmethod
-    def _convert(meme_orm: MemeORM) -> Meme:
-        return Meme(
-            id=meme_orm.id,
-            path=Path(meme_orm.path),
-            hash=meme_orm.hash,
-            valid=meme_orm.valid,
-            description=meme_orm.description,
-            tags=json.loads(meme_orm.tag),
-            usage=meme_orm.usage,
-        )
-
-    @staticmethod
-    async def get_all_memes(
-        session: Union[async_scoped_session, AsyncSession], limit: Optional[int] = None
-    ) -> list[Meme]:
-        """
-        获得全部有效 memes
-        """
-        stmt = select(MemeORM).where(MemeORM.valid == True).limit(limit)  # noqa:E712
-        result = await session.execute(stmt)
-        memes = result.scalars().all()
-        return [MemeRepository._convert(meme) for meme in memes]
-
-    @staticmethod
-    async def get_meme_by_id(
-        session: async_scoped_session, memeid: int
-    ) -> Optional[Meme]:
-        stmt = select(MemeORM).where(MemeORM.id == id)
-        result = await session.execute(stmt)
-        meme = result.scalar_one_or_none()
-        return MemeRepository._convert(meme) if meme else None
-
-    @staticmethod
-    async def save_meme(session: async_scoped_session, meme: Meme):
-        """
-        存储 meme
-        """
-        session.add(
-            MemeORM(
-                path=meme.path.as_posix(),
-                hash=meme.hash,
-                valid=meme.valid,
-                description=meme.description,
-                tag=json.dumps(meme.tags, ensure_ascii=False),
-                usage=meme.usage,
-            )
-        )
-
-    @staticmethod
-    async def remove_meme(
-        session: Union[async_scoped_session, AsyncSession], meme_id: int
-    ):
-        """
-        删除 meme
-
-        这不会真正从表中删除，而是将 meme 标记为 invalid
-        """
-        stmt = update(MemeORM).where(MemeORM.id == meme_id).values(valid=False)
-        await session.execute(stmt)
-
-    @staticmethod
-    async def get_meme_count(session: async_scoped_session) -> int:
-        """
-        获取有效的 Memes 数量
-        """
-        count = await session.execute(
-            select(func.count()).where(MemeORM.valid == True)  # noqa:E712
-        )
-        return count.scalar() or 0
+from typing import Optional, Union
+
+from nonebot_plugin_orm import async_scoped_session
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import Meme
+from .orm_models import MemeORM
+
+
+class MemeRepository:
+    @staticmethod
+    def _convert(meme_orm: MemeORM) -> Meme:
+        return Meme(
+            id=meme_orm.id,
+            path=meme_orm.path,
+            hash=meme_orm.hash,
+            valid=meme_orm.valid,
+            description=meme_orm.description,
+            tags=list(meme_orm.tag) if meme_orm.tag else [],
+            usage=meme_orm.usage,
+        )
+
+    @staticmethod
+    async def get_all_memes(
+        session: Union[async_scoped_session, AsyncSession], limit: Optional[int] = None
+    ) -> list[Meme]:
+        """
+        获得全部有效 memes
+        """
+        stmt = select(MemeORM).where(MemeORM.valid == True).limit(limit)  # noqa:E712
+        result = await session.execute(stmt)
+        memes = result.scalars().all()
+        return [MemeRepository._convert(meme) for meme in memes]
+
+    @staticmethod
+    async def get_meme_by_id(
+        session: async_scoped_session, memeid: int
+    ) -> Optional[Meme]:
+        stmt = select(MemeORM).where(MemeORM.id == memeid)
+        result = await session.execute(stmt)
+        meme = result.scalar_one_or_none()
+        return MemeRepository._convert(meme) if meme else None
+
+    @staticmethod
+    async def get_overflow_meme_ids(
+        session: Union[async_scoped_session, AsyncSession], keep: int
+    ) -> list[int]:
+        """
+        获取按使用次数升序排序后超出保留数量的 meme id
+        """
+        stmt = (
+            select(MemeORM.id)
+            .where(MemeORM.valid == True)  # noqa:E712
+            .order_by(MemeORM.usage.asc())
+            .offset(keep)
+        )
+        result = await session.execute(stmt)
+        return list(result.scalars().all())
+
+    @staticmethod
+    async def save_meme(session: async_scoped_session, meme: Meme):
+        """
+        存储 meme
+        """
+        session.add(
+            MemeORM(
+                path=meme.path,
+                hash=meme.hash,
+                valid=meme.valid,
+                description=meme.description,
+                tag=meme.tags,
+                usage=meme.usage,
+            )
+        )
+
+    @staticmethod
+    async def save_memes(
+        session: Union[async_scoped_session, AsyncSession], memes: list[Meme]
+    ):
+        """
+        批量存储 memes，并将数据库分配的 id 回填到 Meme 对象
+        """
+        meme_orms = [
+            MemeORM(
+                path=meme.path,
+                hash=meme.hash,
+                valid=meme.valid,
+                description=meme.description,
+                tag=meme.tags,
+                usage=meme.usage,
+            )
+            for meme in memes
+        ]
+        session.add_all(meme_orms)
+        await session.flush()
+
+        for meme, meme_orm in zip(memes, meme_orms):
+            meme.id = meme_orm.id
+
+    @staticmethod
+    async def remove_meme(
+        session: Union[async_scoped_session, AsyncSession], meme_id: int
+    ):
+        """
+        删除 meme
+
+        这不会真正从表中删除，而是将 meme 标记为 invalid
+        """
+        stmt = update(MemeORM).where(MemeORM.id == meme_id).values(valid=False)
+        await session.execute(stmt)
+
+    @staticmethod
+    async def remove_memes(
+        session: Union[async_scoped_session, AsyncSession], meme_ids: list[int]
+    ):
+        """
+        批量删除 memes
+
+        这不会真正从表中删除，而是将 memes 标记为 invalid
+        """
+        if not meme_ids:
+            return
+        stmt = update(MemeORM).where(MemeORM.id.in_(meme_ids)).values(valid=False)
+        await session.execute(stmt)
+
+    @staticmethod
+    async def get_meme_count(session: async_scoped_session) -> int:
+        """
+        获取有效的 Memes 数量
+        """
+        count = await session.execute(
+            select(func.count()).where(MemeORM.valid == True)  # noqa:E712
+        )
+        return count.scalar() or 0
@@ -1,22 +1,24 @@
 from nonebot_plugin_orm import Model
-from sqlalchemy import Integer, String
+from sqlalchemy import JSON, Boolean, Index, Integer, String
 from sqlalchemy.orm import Mapped, mapped_column
 
 
 class MemeORM(Model):
+    __table_args__ = (Index("ix_meme_valid_usage", "valid", "usage"),)
+
     id: Mapped[int] = mapped_column(
         primary_key=True, autoincrement=True, comment="Emotion ID"
     )
     path: Mapped[str] = mapped_column(String, nullable=False, comment="表情包路径")
     hash: Mapped[str] = mapped_column(String, nullable=False, comment="表情包哈希值")
     valid: Mapped[bool] = mapped_column(
-        Integer, nullable=False, default=1, comment="表情包是否有效"
+        Boolean, nullable=False, default=True, index=True, comment="表情包是否有效"
     )
     description: Mapped[str] = mapped_column(
         String, nullable=False, comment="表情包描述"
     )
-    tag: Mapped[str] = mapped_column(
-        String, nullable=False, default="_default", comment="表情包标签"
+    tag: Mapped[list[str]] = mapped_column(
+        JSON, nullable=False, default=list, comment="表情包标签"
     )
     usage: Mapped[int] = mapped_column(
         Integer, nullable=False, default=0, comment="表情包使用次数"
@@ -1,409 +1,569 @@
-import json
-import re
-import time
-from hashlib import md5
-from os import remove, replace
-from pathlib import Path
-from typing import Any, Literal, Optional, Union
-
-import httpx
-from jinja2 import Environment, FileSystemLoader
-from jinja2.exceptions import TemplateNotFound
-from muicebot.config import get_model_config
-from muicebot.llm import BaseLLM, ModelCompletions, ModelRequest, load_model
-from muicebot.models import Message, Resource
-from muicebot.muice import Muice
-from nonebot import logger
-from nonebot_plugin_localstore import get_plugin_data_dir
-from nonebot_plugin_orm import async_scoped_session, get_session
-from sqlalchemy.ext.asyncio import AsyncSession
-
-from .config import config
-from .database.crud import MemeRepository
-from .models import Meme
-from .utils import extract_and_combine_gif_frames, process_message
-
-SEARCH_PATH = [Path(__file__).parent / "templates"]
-MEMES_SAVE_PATH = get_plugin_data_dir() / "memes"
-UNION_SESSION = Union[async_scoped_session, AsyncSession]
-
-
-class MemeManager:
-    def __init__(self) -> None:
-        self._all_valid_memes: list[Meme] = []
-        self._all_valid_memes_count: int = 0
-        self._jinja2_env = Environment(loader=FileSystemLoader(SEARCH_PATH))
-        self._multimodal_model: Optional[BaseLLM] = None
-
-    @property
-    def all_valid_memes_count(self) -> int:
-        return self._all_valid_memes_count
-
-    @property
-    def all_valid_memes(self) -> list[Meme]:
-        return self._all_valid_memes
-
-    def _sort_memes(self):
-        """
-        对 memes 进行排序
-        """
-        self._all_valid_memes.sort(key=lambda x: x.usage)
-
-    def _path_to_md5(self, image_path: Path | str) -> str:
-        """
-        将图片转换为 md5
-        """
-        with open(image_path, "rb") as f:
-            image_data = f.read()
-        if not image_data:
-            raise IOError(f"读取图片文件失败: {image_path}")
-        return md5(image_data).hexdigest()
-
-    async def _save_meme(self, resource: Resource) -> Optional[Path]:
-        """
-        保存 Meme 到本地
-        """
-        logger.debug("正在保存 Meme...")
-
-        resource.ensure_mimetype()  # 获取正确的类型
-        meme_extension = resource.extension or ".png"
-        meme_name = f"{int(time.time())}{meme_extension}"
-        meme_path = MEMES_SAVE_PATH / meme_name
-        if not meme_path.parent.exists():
-            meme_path.parent.mkdir(parents=True, exist_ok=True)
-
-        meme_url = resource.url or resource.path
-        if meme_url.startswith("http"):
-            async with httpx.AsyncClient() as client:
-                response = await client.get(meme_url)
-                if response.status_code == 200:
-                    with open(meme_path, "wb") as f:
-                        f.write(response.content)
-                else:
-                    logger.error(f"下载 Meme 失败: {response.status_code}")
-                    return None
-        else:
-            # 如果是本地路径，直接复制
-            meme_path.write_bytes(Path(resource.path).read_bytes())
-
-        return meme_path if meme_path.is_file() else None
-
-    def _generate_prompt_from_template(self, template_name: str) -> str:
-        """
-        获取提示词
-        （使用Jinja2模板引擎的目的是为了后续可能的扩展）
-        """
-        env = Environment(loader=FileSystemLoader(SEARCH_PATH))
-
-        if not template_name.endswith((".j2", ".jinja2")):
-            template_name += ".jinja2"
-        try:
-            template = env.get_template(template_name)
-        except TemplateNotFound:
-            logger.error(f"模板文件 {template_name} 未找到!")
-            raise
-
-        prompt = template.render()
-
-        return prompt
-
-    async def _chat_with_model(
-        self,
-        prompt: str,
-        system: str,
-        image: Resource,
-        format: Literal["json", "str", "int"] = "str",
-    ) -> Any:
-        """
-        与 llm 交互
-
-        :raise RuntimeError: LLM 尚未运行或不是多模态
-        """
-        if not self._multimodal_model:
-            if config.meme_multimodal_config:
-                self._multimodal_model = load_model(
-                    get_model_config(config.meme_multimodal_config)
-                )
-                self._multimodal_model.load()
-            else:
-                self._multimodal_model = Muice.get_instance().model
-
-        model = self._multimodal_model
-        if not (model and model.is_running):
-            raise RuntimeError("LLM 尚未运行！")
-        elif not model.config.multimodal:
-            raise RuntimeError("LLM 不是多模态的！")
-
-        model_request = ModelRequest(prompt, system=system, resources=[image])
-        response_usage = -1
-        logger.debug(f"向 LLM 发送请求: {model_request}")
-
-        response = await model.ask(model_request, stream=model.config.stream)
-
-        if isinstance(response, ModelCompletions):
-            response_text = response.text
-            response_usage = response.usage
-            response_status = response.succeed
-        else:
-            response_chunks: list[str] = []
-            response_status = True
-            async for chunk in response:
-                response_chunks.append(chunk.chunk)
-                response_usage = chunk.usage or chunk.usage
-                response_status = (
-                    chunk.succeed if not chunk.succeed else response_status
-                )
-            response_text = "".join(response_chunks)
-
-        if not response_status:
-            raise RuntimeError("LLM 调用失败！")
-        response_text = process_message(response_text)
-
-        logger.debug(f"LLM 请求已完成，用量: {response_usage}")
-
-        if format == "int":
-            try:
-                response_int = int(response_text)
-            except ValueError:
-                logger.warning(
-                    f"尝试提取模型回复时出现错误，尝试提取数字: {response_text}"
-                )
-                match = re.search(r"\d+", response_text)
-                if match:
-                    response_int = int(match.group())
-                else:
-                    response_int = 0
-                logger.warning(f"提取结果: {response_int}")
-
-            return response_int
-        elif format == "json":
-            try:
-                # 防止出现代码块
-                escaped_str = re.findall(
-                    r"```(?:\w+)?\n(.*?)```", response_text, re.DOTALL
-                )[0]
-                json_text = escaped_str.replace(r"\n", "\n").replace(r"\t", "\t")
-                return json.loads(json_text)
-            except json.JSONDecodeError:
-                logger.error(
-                    f"尝试提取模型回复时出现错误，无法将其转换为JSON格式: {response_text}"
-                )
-                raise
-        else:
-            return response_text
-
-    async def _check_memes_valid(
-        self, session: UNION_SESSION, memes: list[Meme]
-    ) -> list[Meme]:
-        """
-        [预检] 检查所有 Memes 有效性
-        """
-        logger.debug("检查 Memes 完整性")
-        valid_memes: list[Meme] = memes.copy()
-        invalid_memes: list[Meme] = []
-
-        for index, meme in enumerate(memes):
-            if not meme.path.is_file():
-                invalid_memes.append(meme)
-                del valid_memes[index - len(invalid_memes) + 1]
-
-        for invalid_meme in invalid_memes:
-            await self._delete_meme(session, invalid_meme, init=True)
-
-        if invalid_memes:
-            await session.commit()
-            logger.info(f"已从数据库中清除了 {len(invalid_memes)} 个无效 Memes")
-        else:
-            logger.info("所有 Memes 检查通过，没有无效 Memes")
-
-        return valid_memes
-
-    async def _load_memes(self):
-        """
-        [初始化] 从数据库中获取所有 Meme
-        """
-        session = get_session()
-        async with session.begin():
-            memes = await MemeRepository.get_all_memes(session)
-            memes = await self._check_memes_valid(session, memes)
-
-        self._all_valid_memes = memes
-        self._all_valid_memes_count = len(memes)
-
-        logger.info(f"一共加载了 {self._all_valid_memes_count} 个有效 Memes")
-
-    async def _delete_meme(self, session: UNION_SESSION, meme: Meme, init=False):
-        """
-        删除指定 Meme
-
-        :param session: 数据库会话
-        :param meme: Meme 对象
-        :param init: 当前是否是在初始化过程中，即 _all_valid_memes 还未加载
-        """
-        if meme.path.is_file():
-            remove(meme.path)
-
-        await MemeRepository.remove_meme(session, meme.id)  # type:ignore
-
-        if not init:
-            self._all_valid_memes.remove(meme)
-            self._all_valid_memes_count -= 1
-
-    async def auto_clean_memes(self, session: async_scoped_session):
-        """
-        自动删除不使用的 memes
-        """
-        if self._all_valid_memes_count <= config.max_memes:
-            return
-
-        logger.info("Meme 数量已达上限，正在执行自动清理...")
-
-        self._sort_memes()
-        memes_to_delete = self._all_valid_memes[config.max_memes :]
-        for meme in memes_to_delete:
-            await self._delete_meme(session, meme)
-
-        logger.info(
-            f"已删除 {len(memes_to_delete)} 个 Memes，当前有效 Memes 数量为 {self._all_valid_memes_count}"
-        )
-        await session.commit()
-        logger.info("自动清理 Memes 完成")
-
-    async def add_new_meme(
-        self, session: async_scoped_session, meme_image: Resource
-    ) -> bool:
-        """
-        添加 Meme
-
-        :return: 是否添加成功
-        """
-        if meme_image.type != "image":
-            raise ValueError("此类型不是 image 类型！")
-
-        new_meme_path = Path(meme_image.path)
-        new_meme_hash = self._path_to_md5(new_meme_path)
-
-        if any(new_meme_hash == meme.hash for meme in self._all_valid_memes):
-            logger.debug("检查到此 meme 已存在，停止添加")
-            return False
-
-        if new_meme_path.stat().st_size > config.max_meme_size:
-            logger.debug("检测到此 meme 太大，停止添加")
-            return False
-
-        # 确保实际文件类型与文件扩展名一致
-        meme_image.ensure_mimetype()
-        meme_extension = meme_image.extension or new_meme_path.suffix
-
-        if meme_extension.lower() != new_meme_path.suffix.lower():
-            logger.warning("实际扩展名与文件名所提供的扩展名不一致，尝试修改...")
-            current_suffix_path = new_meme_path.with_suffix(meme_extension)
-            replace(new_meme_path, current_suffix_path)
-            meme_image.path = str(current_suffix_path)
-            new_meme_path = current_suffix_path
-
-        old_meme_image_path = meme_image.path
-        gif_to_png_path = None
-
-        if meme_extension.lower() == ".gif":
-            logger.debug("临时将gif转换为png以供 LLM 审查")
-            gif_to_png_bytes = extract_and_combine_gif_frames(new_meme_path)
-            gif_to_png_path = new_meme_path.with_suffix(".png")
-            gif_to_png_path.write_bytes(gif_to_png_bytes.read())
-            meme_image.path = str(gif_to_png_path)
-
-        if config.meme_security_check:
-            logger.debug("正在进行安全检查...")
-            try:
-                check_result: int = await self._chat_with_model(
-                    "回复纯数字0或1",
-                    system=self._generate_prompt_from_template(
-                        "meme_security_check.jinja2"
-                    ),
-                    image=meme_image,
-                    format="int",
-                )
-            except RuntimeError as e:
-                logger.warning(f"尝试调用LLM时出现问题:{e}, 已停止添加")
-                return False
-            if not check_result:
-                logger.warning("此表情包未通过安全检查！已停止添加")
-                return False
-
-        logger.debug("调用LLM生成表情包描述...")
-        try:
-            meme_desc: dict[str, Any] = await self._chat_with_model(
-                "以JSON格式生成标签和内容",
-                system=self._generate_prompt_from_template("meme_description.jinja2"),
-                image=meme_image,
-                format="json",
-            )
-        except RuntimeError as e:
-            logger.warning(f"尝试调用LLM时出现问题:{e}, 已停止添加")
-            return False
-
-        meme_image.path = old_meme_image_path
-        # 删除临时生成的 PNG 文件（如果有）
-        if gif_to_png_path and new_meme_path.suffix != ".png":
-            gif_to_png_path.unlink()
-
-        meme_local_path = await self._save_meme(meme_image)
-        if not meme_local_path:
-            return False
-
-        new_meme = Meme(
-            path=meme_local_path,
-            hash=new_meme_hash,
-            description=meme_desc.get("desc", ""),
-            tags=meme_desc.get("tags", []),
-        )
-
-        await self.auto_clean_memes(session)
-        await MemeRepository.save_meme(session, new_meme)
-        self._all_valid_memes.append(new_meme)
-        self._all_valid_memes_count += 1
-
-        logger.success(
-            f"已成功添加新的表情包！描述:{new_meme.description}, 标签: {new_meme.tags}"
-        )
-
-        return True
-
-    async def query_meme(self, message: Message) -> Optional[Meme]:
-        """
-        查询对话中适用的 meme
-        """
-        # if config.similarity_method == "cosine":
-        #     pass
-        if config.meme_similarity_method == "levenshtein":
-            from .similarity.levenshtein import query_meme
-
-            meme_id = query_meme(message, self._all_valid_memes)
-        elif config.meme_similarity_method == "llm":
-            from .similarity.llm import llm_query
-
-            meme_id = await llm_query(message, self._all_valid_memes)
-        elif config.meme_similarity_method == "cosine":
-            from .similarity.cosine import cosine_query
-
-            meme_id = await cosine_query(message, self._all_valid_memes)
-        else:
-            raise ValueError(
-                f"未找到要求的相似度匹配算法: {config.meme_similarity_method}"
-            )
-
-        if meme_id == -1:
-            logger.info("未找到合适的 Meme, 跳过")
-            return None
-
-        meme = next(
-            (meme for meme in self._all_valid_memes if meme.id == meme_id), None
-        )
-        if not meme:
-            logger.warning(f"未找到匹配的 Meme，ID: {meme_id}")
-            return None
-
-        logger.info(
-            f"查询到 Meme: {meme.id}, 标签: {meme.tags}, 描述: {meme.description}"
-        )
-        return meme
+import asyncio
+import hashlib
+import inspect
+import json
+import re
+import shutil
+import time
+from collections import OrderedDict
+from hashlib import blake2b, md5
+from importlib import import_module
+from io import StringIO
+from os import remove, replace
+from os.path import isfile
+from pathlib import Path
+from typing import Any, Callable, Literal, Optional, Union
+
+import httpx
+import orjson
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+from jinja2.exceptions import TemplateNotFound
+from muicebot.config import get_model_config
+from muicebot.llm import BaseLLM, ModelCompletions, ModelRequest, load_model
+from muicebot.models import Message, Resource
+from muicebot.muice import Muice
+from nonebot import logger
+from nonebot_plugin_localstore import get_plugin_data_dir
+from nonebot_plugin_orm import async_scoped_session, get_session
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .config import config
+from .database.crud import MemeRepository
+from .models import Meme
+from .utils import extract_and_combine_gif_frames, process_message
+
+SEARCH_PATH = [Path(__file__).parent / "templates"]
+MEMES_SAVE_PATH = get_plugin_data_dir() / "memes"
+JINJA_CACHE_PATH = get_plugin_data_dir() / "jinja_cache"
+UNION_SESSION = Union[async_scoped_session, AsyncSession]
+QUERY_CACHE_SIZE = 128
+
+_DIGIT_RE = re.compile(r"\d+")
+_JSON_DECODER = json.JSONDecoder()
+
+_SIMILARITY_ENTRYPOINTS = {
+    "levenshtein": "query_meme",
+    "llm": "llm_query",
+    "cosine": "cosine_query",
+}
+_similarity_impls: dict[str, Callable[..., Any]] = {}
+
+
+def _get_similarity_impl(method: str) -> Callable[..., Any]:
+    """
+    按配置懒加载相似度实现，仅首次调用触发 import，之后为字典查找
+
+    :raise ValueError: 未找到要求的相似度匹配算法
+    """
+    impl = _similarity_impls.get(method)
+    if impl is not None:
+        return impl
+
+    entrypoint = _SIMILARITY_ENTRYPOINTS.get(method)
+    if entrypoint is None:
+        raise ValueError(f"未找到要求的相似度匹配算法: {method}")
+
+    module = import_module(f".similarity.{method}", __package__)
+    impl = getattr(module, entrypoint)
+    _similarity_impls[method] = impl
+    return impl
+
+
+class MemeManager:
+    def __init__(self) -> None:
+        self._all_valid_memes: list[Meme] = []
+        self._hash_index: set[str] = set()
+        self._id_index: dict[int, Meme] = {}
+        JINJA_CACHE_PATH.mkdir(parents=True, exist_ok=True)
+        self._jinja2_env = Environment(
+            loader=FileSystemLoader(SEARCH_PATH),
+            auto_reload=False,
+            cache_size=64,
+            bytecode_cache=FileSystemBytecodeCache(directory=str(JINJA_CACHE_PATH)),
+        )
+        self._prompt_cache: dict[str, str] = {}
+        self._multimodal_model: Optional[BaseLLM] = None
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._pending_memes: list[Meme] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._query_cache: OrderedDict[str, int] = OrderedDict()
+
+    @property
+    def all_valid_memes_count(self) -> int:
+        return len(self._all_valid_memes)
+
+    @property
+    def all_valid_memes(self) -> list[Meme]:
+        return self._all_valid_memes
+
+    def _path_to_md5(self, image_path: Path | str) -> str:
+        """
+        将图片转换为 md5
+
+        Python 3.11+ 由 hashlib.file_digest 在 C 层完成整个哈希循环；
+        旧版本回退为分块读取，内存始终保持 O(chunk)
+        """
+        with open(image_path, "rb") as f:
+            if hasattr(hashlib, "file_digest"):
+                file_hash = hashlib.file_digest(f, "md5")
+            else:  # Python < 3.11
+                file_hash = md5()
+                for chunk in iter(lambda: f.read(65536), b""):
+                    file_hash.update(chunk)
+            if not f.tell():
+                raise IOError(f"读取图片文件失败: {image_path}")
+        return file_hash.hexdigest()
+
+    async def _save_meme(self, resource: Resource) -> Optional[Path]:
+        """
+        保存 Meme 到本地
+        """
+        logger.debug("正在保存 Meme...")
+
+        resource.ensure_mimetype()  # 获取正确的类型
+        meme_extension = resource.extension or ".png"
+        meme_name = f"{int(time.time())}{meme_extension}"
+        meme_path = MEMES_SAVE_PATH / meme_name
+        if not meme_path.parent.exists():
+            meme_path.parent.mkdir(parents=True, exist_ok=True)
+
+        meme_url = resource.url or resource.path
+        if meme_url.startswith("http"):
+            # 复用长连接客户端，向同一图床的多次下载可以吃到 keep-alive
+            if self._http_client is None:
+                self._http_client = httpx.AsyncClient(
+                    timeout=30.0,
+                    limits=httpx.Limits(max_keepalive_connections=10),
+                )
+            response = await self._http_client.get(meme_url)
+            if response.status_code == 200:
+                with open(meme_path, "wb") as f:
+                    f.write(response.content)
+            else:
+                logger.error(f"下载 Meme 失败: {response.status_code}")
+                return None
+        else:
+            # 如果是本地路径，直接复制（Linux 下走 sendfile 内核级拷贝）
+            await asyncio.to_thread(shutil.copyfile, resource.path, meme_path)
+
+        return meme_path if meme_path.is_file() else None
+
+    def _generate_prompt_from_template(self, template_name: str) -> str:
+        """
+        获取提示词
+        （使用Jinja2模板引擎的目的是为了后续可能的扩展）
+
+        模板渲染不需要上下文，因此渲染结果直接按模板名缓存
+        """
+        if not template_name.endswith((".j2", ".jinja2")):
+            template_name += ".jinja2"
+
+        if template_name in self._prompt_cache:
+            return self._prompt_cache[template_name]
+
+        try:
+            template = self._jinja2_env.get_template(template_name)
+        except TemplateNotFound:
+            logger.error(f"模板文件 {template_name} 未找到!")
+            raise
+
+        prompt = template.render()
+        self._prompt_cache[template_name] = prompt
+
+        return prompt
+
+    async def _chat_with_model(
+        self,
+        prompt: str,
+        system: str,
+        image: Resource,
+        format: Literal["json", "str", "int"] = "str",
+    ) -> Any:
+        """
+        与 llm 交互
+
+        :raise RuntimeError: LLM 尚未运行或不是多模态
+        """
+        if not self._multimodal_model:
+            if config.meme_multimodal_config:
+                self._multimodal_model = load_model(
+                    get_model_config(config.meme_multimodal_config)
+                )
+                self._multimodal_model.load()
+            else:
+                self._multimodal_model = Muice.get_instance().model
+
+        model = self._multimodal_model
+        if not (model and model.is_running):
+            raise RuntimeError("LLM 尚未运行！")
+        elif not model.config.multimodal:
+            raise RuntimeError("LLM 不是多模态的！")
+
+        model_request = ModelRequest(prompt, system=system, resources=[image])
+        response_usage = -1
+        logger.debug(f"向 LLM 发送请求: {model_request}")
+
+        response = await model.ask(model_request, stream=model.config.stream)
+
+        if isinstance(response, ModelCompletions):
+            response_text = response.text
+            response_usage = response.usage
+            response_status = response.succeed
+        else:
+            response_buffer = StringIO()
+            response_status = True
+            async for chunk in response:
+                response_buffer.write(chunk.chunk)
+                response_usage = chunk.usage or response_usage
+                response_status = (
+                    chunk.succeed if not chunk.succeed else response_status
+                )
+            response_text = response_buffer.getvalue()
+
+        if not response_status:
+            raise RuntimeError("LLM 调用失败！")
+        response_text = process_message(response_text)
+
+        logger.debug(f"LLM 请求已完成，用量: {response_usage}")
+
+        if format == "int":
+            try:
+                response_int = int(response_text)
+            except ValueError:
+                logger.warning(
+                    f"尝试提取模型回复时出现错误，尝试提取数字: {response_text}"
+                )
+                match = _DIGIT_RE.search(response_text)
+                if match:
+                    response_int = int(match.group())
+                else:
+                    response_int = 0
+                logger.warning(f"提取结果: {response_int}")
+
+            return response_int
+        elif format == "json":
+            try:
+                # 防止出现代码块：用 C 级子串查找截取围栏内容，避免正则回溯
+                fence_start = response_text.find("```")
+                if fence_start != -1:
+                    json_start = response_text.find("\n", fence_start) + 1
+                    json_end = response_text.find("```", json_start)
+                    if json_end == -1:
+                        json_end = len(response_text)
+                    return orjson.loads(response_text[json_start:json_end])
+
+                # 没有围栏时，从第一个 { 开始解析 JSON 前缀
+                brace_start = response_text.find("{")
+                if brace_start == -1:
+                    raise json.JSONDecodeError("未找到 JSON 对象", response_text, 0)
+                response_json, _ = _JSON_DECODER.raw_decode(response_text, brace_start)
+                return response_json
+            except json.JSONDecodeError:
+                logger.error(
+                    f"尝试提取模型回复时出现错误，无法将其转换为JSON格式: {response_text}"
+                )
+                raise
+        else:
+            return response_text
+
+    async def _check_memes_valid(
+        self, session: UNION_SESSION, memes: list[Meme]
+    ) -> list[Meme]:
+        """
+        [预检] 检查所有 Memes 有效性
+        """
+        logger.debug("检查 Memes 完整性")
+
+        existences = await asyncio.gather(
+            *(asyncio.to_thread(isfile, meme.path) for meme in memes)
+        )
+
+        valid_memes = [meme for meme, exist in zip(memes, existences) if exist]
+        invalid_memes = [meme for meme, exist in zip(memes, existences) if not exist]
+
+        await self._delete_memes(session, invalid_memes, init=True)
+
+        if invalid_memes:
+            # 由 _load_memes 的事务块在退出时统一提交
+            logger.info(f"已从数据库中清除了 {len(invalid_memes)} 个无效 Memes")
+        else:
+            logger.info("所有 Memes 检查通过，没有无效 Memes")
+
+        return valid_memes
+
+    async def _load_memes(self):
+        """
+        [初始化] 从数据库中获取所有 Meme
+        """
+        # 提示词模板渲染结果固定，启动时预热缓存，请求路径上只剩字典查找
+        self._generate_prompt_from_template("meme_security_check.jinja2")
+        self._generate_prompt_from_template("meme_description.jinja2")
+
+        session = get_session()
+        async with session.begin():
+            memes = await MemeRepository.get_all_memes(session)
+            memes = await self._check_memes_valid(session, memes)
+
+        self._all_valid_memes = memes
+        self._hash_index = {meme.hash for meme in memes}
+        self._id_index = {meme.id: meme for meme in memes}
+
+        logger.info(f"一共加载了 {self.all_valid_memes_count} 个有效 Memes")
+
+    async def _delete_memes(
+        self, session: UNION_SESSION, memes: list[Meme], init=False
+    ):
+        """
+        批量删除指定 Memes
+
+        文件删除并发执行，数据库侧只产生一条批量更新语句
+
+        :param session: 数据库会话
+        :param memes: Meme 对象列表
+        :param init: 当前是否是在初始化过程中，即 _all_valid_memes 还未加载
+        """
+        if not memes:
+            return
+
+        existences = await asyncio.gather(
+            *(asyncio.to_thread(isfile, meme.path) for meme in memes)
+        )
+        await asyncio.gather(
+            *(
+                asyncio.to_thread(remove, meme.path)
+                for meme, exist in zip(memes, existences)
+                if exist
+            )
+        )
+
+        await MemeRepository.remove_memes(session, [meme.id for meme in memes])
+
+        if not init:
+            removed_ids = {meme.id for meme in memes}
+            self._all_valid_memes = [
+                meme for meme in self._all_valid_memes if meme.id not in removed_ids
+            ]
+            self._hash_index.difference_update(meme.hash for meme in memes)
+            for meme in memes:
+                self._id_index.pop(meme.id, None)
+            for key in [
+                key for key, value in self._query_cache.items() if value in removed_ids
+            ]:
+                del self._query_cache[key]
+
+    async def auto_clean_memes(self, session: async_scoped_session):
+        """
+        自动删除不使用的 memes
+        """
+        if self.all_valid_memes_count <= config.max_memes:
+            return
+
+        logger.info("Meme 数量已达上限，正在执行自动清理...")
+
+        overflow_ids = set(
+            await MemeRepository.get_overflow_meme_ids(session, config.max_memes)
+        )
+        memes_to_delete = [
+            meme for meme in self._all_valid_memes if meme.id in overflow_ids
+        ]
+        await self._delete_memes(session, memes_to_delete)
+
+        logger.info(
+            f"已删除 {len(memes_to_delete)} 个 Memes，当前有效 Memes 数量为 {self.all_valid_memes_count}"
+        )
+        await session.commit()
+        logger.info("自动清理 Memes 完成")
+
+    async def add_new_meme(
+        self, session: async_scoped_session, meme_image: Resource
+    ) -> bool:
+        """
+        添加 Meme
+
+        :return: 是否添加成功
+        """
+        if meme_image.type != "image":
+            raise ValueError("此类型不是 image 类型！")
+
+        new_meme_path = Path(meme_image.path)
+        new_meme_hash = await asyncio.to_thread(self._path_to_md5, new_meme_path)
+
+        if new_meme_hash in self._hash_index:
+            logger.debug("检查到此 meme 已存在，停止添加")
+            return False
+
+        if new_meme_path.stat().st_size > config.max_meme_size:
+            logger.debug("检测到此 meme 太大，停止添加")
+            return False
+
+        # 确保实际文件类型与文件扩展名一致
+        meme_image.ensure_mimetype()
+        meme_extension = meme_image.extension or new_meme_path.suffix
+
+        if meme_extension.lower() != new_meme_path.suffix.lower():
+            logger.warning("实际扩展名与文件名所提供的扩展名不一致，尝试修改...")
+            current_suffix_path = new_meme_path.with_suffix(meme_extension)
+            replace(new_meme_path, current_suffix_path)
+            meme_image.path = str(current_suffix_path)
+            new_meme_path = current_suffix_path
+
+        old_meme_image_path = meme_image.path
+        gif_to_png_path = None
+
+        if meme_extension.lower() == ".gif":
+            logger.debug("临时将gif转换为png以供 LLM 审查")
+            # PIL 解码与拼图是纯 CPU 工作，移出事件循环
+            gif_to_png_bytes = await asyncio.to_thread(
+                extract_and_combine_gif_frames, new_meme_path
+            )
+            gif_to_png_path = new_meme_path.with_suffix(".png")
+            # getbuffer 直接暴露 BytesIO 内部缓冲，省去 read() 的整份拷贝
+            gif_to_png_path.write_bytes(gif_to_png_bytes.getbuffer())
+            meme_image.path = str(gif_to_png_path)
+
+        desc_coro = self._chat_with_model(
+            "以JSON格式生成标签和内容",
+            system=self._generate_prompt_from_template("meme_description.jinja2"),
+            image=meme_image,
+            format="json",
+        )
+
+        try:
+            if config.meme_security_check:
+                # 安全检查与描述生成相互独立，并发执行以缩短保存时延
+                # return_exceptions 保证两个任务的异常都被取回，
+                # 一方失败时另一方不会留下"未检索的任务异常"告警
+                logger.debug("调用LLM进行安全检查并生成表情包描述...")
+                results = await asyncio.gather(
+                    self._chat_with_model(
+                        "回复纯数字0或1",
+                        system=self._generate_prompt_from_template(
+                            "meme_security_check.jinja2"
+                        ),
+                        image=meme_image,
+                        format="int",
+                    ),
+                    desc_coro,
+                    return_exceptions=True,
+                )
+                check_result, meme_desc = results
+                if isinstance(check_result, BaseException):
+                    raise check_result
+                if isinstance(meme_desc, BaseException):
+                    raise meme_desc
+            else:
+                logger.debug("调用LLM生成表情包描述...")
+                check_result = 1
+                meme_desc = await desc_coro
+        except RuntimeError as e:
+            logger.warning(f"尝试调用LLM时出现问题:{e}, 已停止添加")
+            return False
+
+        if not check_result:
+            logger.warning("此表情包未通过安全检查！已停止添加")
+            return False
+
+        meme_image.path = old_meme_image_path
+        # 删除临时生成的 PNG 文件（如果有）
+        if gif_to_png_path and new_meme_path.suffix != ".png":
+            gif_to_png_path.unlink()
+
+        meme_local_path = await self._save_meme(meme_image)
+        if not meme_local_path:
+            return False
+
+        new_meme = Meme(
+            path=meme_local_path.as_posix(),
+            hash=new_meme_hash,
+            description=meme_desc.get("desc", ""),
+            tags=meme_desc.get("tags", []),
+        )
+
+        await self.auto_clean_memes(session)
+
+        # 延迟落库：合并短时间窗口内的多次保存，摊薄提交开销
+        self._pending_memes.append(new_meme)
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_memes_later())
+
+        self._all_valid_memes.append(new_meme)
+        self._hash_index.add(new_meme_hash)
+
+        logger.success(
+            f"已成功添加新的表情包！描述:{new_meme.description}, 标签: {new_meme.tags}"
+        )
+
+        return True
+
+    async def _flush_memes_later(self, delay: float = 0.1):
+        """
+        等待合并窗口结束后批量落库
+        """
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            self._flush_task = None
+        await self.flush_memes()
+
+    async def aclose(self):
+        """
+        关闭持有的网络资源
+        """
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+
+    async def flush_memes(self):
+        """
+        立即将待保存的 Memes 批量写入数据库
+        """
+        if not self._pending_memes:
+            return
+
+        pending, self._pending_memes = self._pending_memes, []
+        session = get_session()
+        async with session.begin():
+            await MemeRepository.save_memes(session, pending)
+
+        # 落库后 Meme 才拿到数据库分配的 id，此时再写入 id 索引
+        for meme in pending:
+            self._id_index[meme.id] = meme
+
+        logger.debug(f"已批量保存 {len(pending)} 个 Memes")
+
+    async def query_meme(self, message: Message) -> Optional[Meme]:
+        """
+        查询对话中适用的 meme
+        """
+        # 最近查询缓存：相同回复文本的重复查询直接复用上次结果
+        cache_key = blake2b(message.respond.encode("utf-8"), digest_size=8).hexdigest()
+        cached_id = self._query_cache.get(cache_key)
+        if cached_id is not None:
+            cached_meme = self._id_index.get(cached_id)
+            if cached_meme:
+                self._query_cache.move_to_end(cache_key)
+                logger.debug(f"查询缓存命中: {cached_meme.id}")
+                return cached_meme
+            self._query_cache.pop(cache_key, None)
+
+        impl = _get_similarity_impl(config.meme_similarity_method)
+        result = impl(message, self._all_valid_memes)
+        meme_id: int = await result if inspect.isawaitable(result) else result
+
+        if meme_id == -1:
+            logger.info("未找到合适的 Meme, 跳过")
+            return None
+
+        meme = self._id_index.get(meme_id)
+        if not meme:
+            logger.warning(f"未找到匹配的 Meme，ID: {meme_id}")
+            return None
+
+        self._query_cache[cache_key] = meme.id
+        if len(self._query_cache) > QUERY_CACHE_SIZE:
+            self._query_cache.popitem(last=False)
+
+        logger.info(
+            f"查询到 Meme: {meme.id}, 标签: {meme.tags}, 描述: {meme.description}"
+        )
+        return meme
@@ -2,12 +2,12 @@ from dataclasses import dataclass, field
 from pathlib import Path
 
 
-@dataclass
+@dataclass(slots=True)
 class Meme:
     id: int = -1
     """表情包ID"""
-    path: Path = field(default_factory=Path)
-    """表情包路径"""
+    path: str = ""
+    """表情包路径(posix 字符串)"""
     hash: str = ""
     """表情包哈希值"""
     valid: bool = True
@@ -20,5 +20,5 @@ class Meme:
     """表情包使用次数"""
 
     def __post_init__(self):
-        if isinstance(self.path, str):
-            self.path = Path(self.path)
+        if isinstance(self.path, Path):
+            self.path = self.path.as_posix()
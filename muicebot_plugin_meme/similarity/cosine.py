@@ -1,12 +1,11 @@
-import json
-from hashlib import md5, sha256
-from pathlib import Path
+import asyncio
+from collections import OrderedDict
+from hashlib import blake2b
 from time import perf_counter
 from typing import Optional
 
 import numpy as np
 import openai
-from async_lru import alru_cache
 from muicebot.models import Message
 from nonebot import logger
 from nonebot_plugin_localstore import get_plugin_data_dir
@@ -14,166 +13,165 @@ from numpy import ndarray
 
 from ..config import config
 from ..models import Meme
+from .embedding_store import EmbeddingStore
 
 client = openai.AsyncOpenAI(
     base_url=config.meme_embedding_base_url,
     api_key=config.meme_embedding_service_api_key,
 )
 
-# 初始化嵌入缓存目录
+# 初始化嵌入缓存
+embedding_store: Optional[EmbeddingStore]
 if config.meme_embedding_cache_enabled:
     cache_dir = get_plugin_data_dir() / "embedding"
     cache_dir.mkdir(parents=True, exist_ok=True)
+    embedding_store = EmbeddingStore(cache_dir, config.meme_embedding_model)
 else:
-    cache_dir = None
+    embedding_store = None
 
 
-def _get_embedding_cache_path(text: str) -> Optional[Path]:
-    """
-    获取嵌入缓存文件路径
-
-    :param text: 查询文本
-    """
-    if not cache_dir:
-        return None
-
-    # 根据文本和模型名称生成缓存键
-    content = f"{config.meme_embedding_model}:{text}"
-    cache_key = md5(content.encode("utf-8")).hexdigest()
-
-    return cache_dir / cache_key
+# 进程内向量缓存：键与磁盘存储一致，命中时完全绕开磁盘与网络
+_MEMORY_CACHE_SIZE = 1024
+_memory_cache: OrderedDict[str, ndarray] = OrderedDict()
 
 
-def _load_embedding_from_cache(text: str) -> Optional[ndarray]:
+def _cache_key(text: str) -> str:
     """
-    从缓存文件中加载嵌入向量
+    根据文本和模型名称生成缓存键
 
-    :param text: 查询文本
+    blake2b 在长文本上明显快于 MD5/SHA-256，16 字节摘要足够避免碰撞
     """
-    if not config.meme_embedding_cache_enabled:
-        return None
-
-    try:
-        cache_path = _get_embedding_cache_path(text)
-        if not cache_path:
-            return None
-
-        meta_path = cache_path.with_suffix(".json")
-        npy_path = cache_path.with_suffix(".npy")
-
-        if not (meta_path.exists() and npy_path.exists()):
-            return None
-
-        with open(meta_path, "r", encoding="utf-8") as f:
-            meta = json.load(f)
-
-        if (
-            isinstance(meta, dict)
-            and "model" in meta
-            and meta["model"] == config.meme_embedding_model
-            and "text_hash" in meta
-            and meta["text_hash"] == sha256(text.encode("utf-8")).hexdigest()
-        ):
-            embedding = np.load(npy_path)
-            logger.debug(f"从缓存加载嵌入向量: {text[:50]}...")
-            return embedding
-        return None
-
-    except Exception as e:
-        logger.warning(f"加载缓存失败: {e}")
-        return None
+    content = f"{config.meme_embedding_model}:{text}"
+    return blake2b(content.encode("utf-8"), digest_size=16).hexdigest()
 
 
-def _save_to_cache(text: str, embedding: ndarray) -> None:
+def _memory_cache_put(key: str, embedding: ndarray) -> None:
     """
-    将嵌入向量保存到缓存文件
+    写入进程内缓存并按 LRU 淘汰
     """
-    import json
+    _memory_cache[key] = embedding
+    _memory_cache.move_to_end(key)
+    while len(_memory_cache) > _MEMORY_CACHE_SIZE:
+        _memory_cache.popitem(last=False)
 
-    if not config.meme_embedding_cache_enabled or not cache_dir:
-        return
 
-    try:
-        cache_path = _get_embedding_cache_path(text)
-        if not cache_path:
-            return
+async def _get_embeddings_batch(texts: list[str]) -> list[ndarray]:
+    """
+    调用 OpenAI API 兼容端口批量获取字符串的嵌入向量，支持离线缓存
 
-        meta_path = cache_path.with_suffix(".json")
-        npy_path = cache_path.with_suffix(".npy")
+    缓存未命中的文本合并为一次 API 请求，N 次网络往返变为一次
 
-        meta_data = {
-            "model": config.meme_embedding_model,
-            "text_hash": sha256(text.encode("utf-8")).hexdigest(),
-        }
+    :param texts: 要查询的字符串列表
+    :return: 与 texts 顺序一致的嵌入向量列表
+    """
+    embeddings: dict[int, ndarray] = {}
+    miss_indexes: list[int] = []
+
+    cache_keys = [_cache_key(text) for text in texts]
+
+    for index, key in enumerate(cache_keys):
+        cached_embedding = _memory_cache.get(key)
+        if cached_embedding is not None:
+            _memory_cache.move_to_end(key)
+            embeddings[index] = cached_embedding
+            continue
+
+        # memmap 读取可能触发磁盘 IO，移出事件循环
+        if embedding_store:
+            cached_embedding = await asyncio.to_thread(embedding_store.get, key)
+        if cached_embedding is not None:
+            _memory_cache_put(key, cached_embedding)
+            embeddings[index] = cached_embedding
+        else:
+            miss_indexes.append(index)
+
+    if miss_indexes:
+        logger.debug(f"正在批量查询 {len(miss_indexes)} 条文本的嵌入向量...")
+        start_time = perf_counter()
+        try:
+            response = await client.embeddings.create(
+                model=config.meme_embedding_model,
+                input=[texts[index] for index in miss_indexes],
+            )
+        except Exception as e:
+            logger.error(f"获取嵌入向量失败: {e}")
+            raise
+
+        for index, data in zip(miss_indexes, response.data):
+            # 全程使用 float32：内存减半且 SIMD 友好，精度对排序无影响
+            embedding = np.asarray(data.embedding, dtype=np.float32)
+            # 落盘前归一化，余弦相似度退化为纯点积
+            norm = np.linalg.norm(embedding)
+            if norm:
+                embedding /= norm
+            if embedding_store:
+                await asyncio.to_thread(
+                    embedding_store.put, cache_keys[index], embedding
+                )
+            _memory_cache_put(cache_keys[index], embedding)
+            embeddings[index] = embedding
 
-        with open(meta_path, "w", encoding="utf-8") as f:
-            json.dump(meta_data, f)
-        np.save(npy_path, embedding)
+        end_time = perf_counter()
+        logger.debug(f"已完成查询，用时: {end_time - start_time}s")
 
-        logger.debug(f"嵌入向量已缓存: {text[:50]}...")
-    except Exception as e:
-        logger.warning(f"保存缓存失败: {e}")
+    return [embeddings[index] for index in range(len(texts))]
 
 
-@alru_cache(maxsize=1024)
-async def _get_embedding(text: str) -> ndarray:
+class MemeEmbeddingIndex:
     """
-    调用 OpenAI API 兼容端口获取字符串的嵌入向量，支持离线缓存
+    meme 描述嵌入的常驻内存索引
 
-    :param text: 要查询的字符串
+    以 meme id 序列的哈希作为代次标记，meme 集合不变时每次查询
+    直接复用已堆叠好的 (N, D) 矩阵，稳态下不再触碰缓存与磁盘
     """
-    logger.debug(f"正在查询文本嵌入向量: {text[:50]}...")
-
-    # 首先尝试从磁盘缓存加载
-    cached_embedding = _load_embedding_from_cache(text)
-    if cached_embedding is not None:
-        return cached_embedding
 
-    # 缓存未命中，调用 API
-    start_time = perf_counter()
-    try:
-        response = await client.embeddings.create(
-            model=config.meme_embedding_model, input=[text]
-        )
-        embedding = np.array(response.data[0].embedding)
-
-        # 保存到磁盘缓存
-        _save_to_cache(text, embedding)
-
-        end_time = perf_counter()
-        logger.debug(f"已完成查询，用时: {end_time - start_time}s")
-        return embedding
+    def __init__(self) -> None:
+        self.ids: list[int] = []
+        self.matrix: Optional[ndarray] = None
+        self.build_hash = ""
+
+    async def ensure(self, memes: list[Meme]) -> None:
+        """
+        按当前 meme 集合重建索引（若集合未变化则为空操作）
+        """
+        build_hash = blake2b(
+            ",".join(str(meme.id) for meme in memes).encode(), digest_size=8
+        ).hexdigest()
+        if self.build_hash == build_hash:
+            return
 
-    except Exception as e:
-        logger.error(f"获取嵌入向量失败: {e}")
-        raise
+        vectors = await _get_embeddings_batch([meme.description for meme in memes])
+        self.matrix = np.stack(vectors)
+        self.ids = [meme.id for meme in memes]
+        self.build_hash = build_hash
+        logger.debug(f"已重建嵌入索引，共 {len(self.ids)} 条向量")
 
 
-def _cosine_similarity(vec1: ndarray, vec2: ndarray) -> float:
-    """
-    计算两个变量间的余弦相似度
-    """
-    return np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2))
+_meme_index = MemeEmbeddingIndex()
 
 
 async def cosine_query(message: Message, memes: list[Meme]) -> int:
     """
     使用余弦相似度查询 Meme
     """
-    memes = memes[: config.meme_general_max_query]
-    vec1 = await _get_embedding(message.respond)
-    most_similar_meme_index = 0
-    most_similar_meme_cosine = 0.0
+    # 未落库的 meme 还没有真实 id：既无法作为查询结果返回，
+    # 也会让多个不同集合哈希出同一代次标记
+    memes = [meme for meme in memes if meme.id != -1][: config.meme_general_max_query]
+    if not memes:
+        return -1
+
+    await _meme_index.ensure(memes)
+    query_vector = (await _get_embeddings_batch([message.respond]))[0]
 
     start_time = perf_counter()
-    for index, meme in enumerate(memes):
-        vec2 = await _get_embedding(meme.description)
-        cos_sim = _cosine_similarity(vec1, vec2)
-        if cos_sim > most_similar_meme_cosine:
-            most_similar_meme_index = index
-            most_similar_meme_cosine = cos_sim
+
+    # 向量均为归一化 float32，一次 GEMV 即得全部相似度
+    assert _meme_index.matrix is not None
+    similarities = _meme_index.matrix @ query_vector
+    most_similar_meme_id = _meme_index.ids[int(np.argmax(similarities))]
+
     end_time = perf_counter()
 
     logger.info(f"余弦相似度查询耗时: {end_time - start_time}s")
 
-    return most_similar_meme_index
+    return most_similar_meme_id
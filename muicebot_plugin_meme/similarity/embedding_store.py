@@ -0,0 +1,160 @@
+import json
+from os import replace
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from nonebot import logger
+from numpy import ndarray
+
+# 存储格式版本，与 index.json 中的记录不一致时整体重建
+STORE_VERSION = 1
+
+
+class EmbeddingStore:
+    """
+    单文件追加式嵌入向量缓存
+
+    所有向量以 float16 按行追加到 ``vectors.f16.bin``，``index.json`` 记录
+    缓存键到行号的映射以及模型名与向量维度。相比一文本一文件的方案，
+    加载 N 条向量只需一次 ``np.memmap`` 视图与一次花式索引，
+    避免了 N 次 open/read/close 与 N 次 JSON 解码
+    """
+
+    def __init__(self, store_dir: Path, model: str) -> None:
+        self._dir = store_dir
+        self._model = model
+        self._index_path = store_dir / "index.json"
+        self._vectors_path = store_dir / "vectors.f16.bin"
+        self._index: dict[str, int] = {}
+        self._dim = 0
+        self._matrix: Optional[ndarray] = None
+        self._load_index()
+
+    def _load_index(self) -> None:
+        """
+        加载索引文件，版本、模型或向量文件长度不匹配时丢弃旧缓存
+        """
+        if not self._index_path.exists():
+            # 索引缺失时残留的向量文件无法解释，一并清理
+            if self._vectors_path.exists():
+                self._reset()
+            return
+
+        try:
+            with open(self._index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+
+            if (
+                isinstance(data, dict)
+                and data.get("version") == STORE_VERSION
+                and data.get("model") == self._model
+                and isinstance(data.get("keys"), dict)
+            ):
+                index = data["keys"]
+                dim = int(data.get("dim", 0))
+                actual_size = (
+                    self._vectors_path.stat().st_size
+                    if self._vectors_path.exists()
+                    else 0
+                )
+                # 向量文件长度必须与索引严格对应，否则行号已经错位
+                if dim and actual_size == len(index) * dim * 2:
+                    self._index = index
+                    self._dim = dim
+                    return
+                logger.warning("嵌入缓存向量文件与索引不一致，将整体重建")
+            else:
+                logger.debug("嵌入缓存索引已失效，将整体重建")
+        except Exception as e:
+            logger.warning(f"加载嵌入缓存索引失败: {e}")
+
+        self._reset()
+
+    def _reset(self) -> None:
+        """
+        丢弃索引与向量文件，从空缓存重新开始
+        """
+        self._index = {}
+        self._dim = 0
+        self._matrix = None
+        for path in (self._index_path, self._vectors_path):
+            try:
+                path.unlink(missing_ok=True)
+            except OSError as e:
+                logger.warning(f"清理嵌入缓存失败: {e}")
+
+    def _save_index(self) -> None:
+        """
+        原子地写回索引文件
+        """
+        tmp_path = self._index_path.with_suffix(".json.tmp")
+        data = {
+            "version": STORE_VERSION,
+            "model": self._model,
+            "dim": self._dim,
+            "keys": self._index,
+        }
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        replace(tmp_path, self._index_path)
+
+    @property
+    def matrix(self) -> Optional[ndarray]:
+        """
+        全部已缓存向量的只读 (N, dim) float16 视图，按需建立 memmap
+        """
+        if self._matrix is None and self._dim and self._vectors_path.exists():
+            try:
+                flat = np.memmap(self._vectors_path, dtype=np.float16, mode="r")
+                # 行数由实际文件大小推导，尾部的不完整行（写入中断）被忽略
+                rows = flat.size // self._dim
+                self._matrix = flat[: rows * self._dim].reshape(rows, self._dim)
+            except Exception as e:
+                logger.warning(f"读取嵌入缓存失败: {e}")
+                return None
+        return self._matrix
+
+    def get(self, key: str) -> Optional[ndarray]:
+        """
+        按缓存键取回向量，未命中返回 None
+
+        :param key: 缓存键
+        """
+        row = self._index.get(key)
+        if row is None:
+            return None
+
+        matrix = self.matrix
+        if matrix is None or row >= matrix.shape[0]:
+            return None
+
+        return np.asarray(matrix[row], dtype=np.float32)
+
+    def put(self, key: str, embedding: ndarray) -> None:
+        """
+        追加一条向量并更新索引
+
+        :param key: 缓存键
+        :param embedding: 嵌入向量（应当已完成 L2 归一化）
+        """
+        if key in self._index:
+            return
+
+        try:
+            if not self._dim:
+                self._dim = int(embedding.shape[0])
+            elif embedding.shape[0] != self._dim:
+                logger.warning("嵌入向量维度与缓存不一致，已跳过缓存")
+                return
+
+            with open(self._vectors_path, "ab") as f:
+                # 行号由文件实际大小推导，先前写入中断也不会使后续条目错位
+                row = f.tell() // (self._dim * 2)
+                f.write(np.asarray(embedding, dtype=np.float16).tobytes())
+
+            self._index[key] = row
+            self._save_index()
+            self._matrix = None  # 追加后使 memmap 视图失效，下次访问时重建
+        except Exception as e:
+            logger.warning(f"保存嵌入缓存失败: {e}")
@@ -1,5 +1,8 @@
 import random
+import re
+from functools import lru_cache
 from time import time_ns
+from typing import Optional
 
 from muicebot.models import Message
 from nonebot import logger
@@ -10,35 +13,99 @@ from ..models import Meme
 def _levenshtein_distance(s1: str, s2: str) -> int:
     """
     计算两个字符串的编辑距离
+
+    预分配两行并交替复用，内层循环只做下标读写与 min，
+    避免每行重新分配列表和逐格 append 的解释器开销
     """
     if len(s1) < len(s2):
-        return _levenshtein_distance(s2, s1)
+        s1, s2 = s2, s1
 
-    if len(s2) == 0:
+    len2 = len(s2)
+    if len2 == 0:
         return len(s1)
 
-    previous_row = list(range(len(s2) + 1))
-    for i, c1 in enumerate(s1):
-        current_row = [i + 1]
-        for j, c2 in enumerate(s2):
-            insertions = previous_row[j + 1] + 1
-            deletions = current_row[j] + 1
-            substitutions = previous_row[j] + (c1 != c2)
-            current_row.append(min(insertions, deletions, substitutions))
-        previous_row = current_row
+    previous_row = list(range(len2 + 1))
+    current_row = [0] * (len2 + 1)
+
+    for i, c1 in enumerate(s1, 1):
+        current_row[0] = i
+        prev_diag = i - 1
+        for j, c2 in enumerate(s2, 1):
+            above = previous_row[j]
+            cost = prev_diag + (c1 != c2)
+            if above + 1 < cost:
+                cost = above + 1
+            left = current_row[j - 1]
+            if left + 1 < cost:
+                cost = left + 1
+            current_row[j] = cost
+            prev_diag = above
+        previous_row, current_row = current_row, previous_row
 
-    return previous_row[-1]
+    return previous_row[len2]
 
 
-def _extract_keywords(text: str) -> list[str]:
+def _build_pattern_masks(pattern: str) -> dict[str, int]:
     """
-    从文本中提取关键词，假设关键词被括号包围
+    为 Myers 位并行算法预计算模式串每个字符的位掩码
+    """
+    masks: dict[str, int] = {}
+    for i, c in enumerate(pattern):
+        masks[c] = masks.get(c, 0) | (1 << i)
+    return masks
+
+
+def _levenshtein_myers(pattern_masks: dict[str, int], m: int, text: str) -> int:
     """
-    import re
+    Myers 位并行算法计算编辑距离
+
+    模式串不超过 64 字符时，每个文本字符只需常数次整数位运算，
+    结果与逐格 DP 完全一致
+
+    :param pattern_masks: _build_pattern_masks 预计算的字符位掩码
+    :param m: 模式串长度
+    :param text: 文本串
+    """
+    if m == 0:
+        return len(text)
+
+    score = m
+    high_bit = 1 << (m - 1)
+    vp = (1 << m) - 1
+    vn = 0
+
+    for c in text:
+        eq = pattern_masks.get(c, 0)
+        d0 = (((eq & vp) + vp) ^ vp) | eq | vn
+        hp = vn | ~(d0 | vp)
+        hn = vp & d0
+        if hp & high_bit:
+            score += 1
+        if hn & high_bit:
+            score -= 1
+        hp = (hp << 1) | 1
+        vp = (hn << 1) | ~(d0 | hp)
+        vn = hp & d0
+
+    return score
 
-    # 使用正则表达式提取括号中的内容
-    keywords = re.findall(r"\((.*?)\)", text)
-    return [keyword.strip() for keyword in keywords if keyword.strip()]
+
+# Myers 算法单机器字可容纳的最大模式串长度
+_MYERS_MAX_LEN = 64
+
+# 模块级预编译的括号关键词正则
+_PAREN_RE = re.compile(r"\((.*?)\)")
+
+
+@lru_cache(maxsize=4096)
+def _extract_keywords(text: str) -> tuple[str, ...]:
+    """
+    从文本中提取关键词，假设关键词被括号包围
+
+    同一条回复可能被多次查询，结果以不可变元组缓存
+    """
+    keywords = _PAREN_RE.findall(text)
+    return tuple(keyword.strip() for keyword in keywords if keyword.strip())
 
 
 def query_meme(message: Message, memes: list[Meme]) -> int:
@@ -51,22 +118,48 @@ def query_meme(message: Message, memes: list[Meme]) -> int:
         return -1
 
     logger.debug(f"提取到的关键词: {keywords}")
+
+    # 在 meme 循环外为每个短关键词预计算一次位掩码
+    keyword_matchers = [
+        (
+            keyword,
+            _build_pattern_masks(keyword) if len(keyword) <= _MYERS_MAX_LEN else None,
+        )
+        for keyword in keywords
+    ]
+
+    # 单趟线性扫描记录每个 meme 的最小距离，免去逐三元组建表再整体排序
     meme_scores: list[tuple[Meme, int]] = []
+    min_distance: Optional[int] = None
 
     t1 = time_ns()
     for meme in memes:
+        meme_min: Optional[int] = None
         for tag in meme.tags:
-            for keyword in keywords:
-                distance = _levenshtein_distance(tag, keyword)
-                meme_scores.append((meme, distance))
+            tag_len = len(tag)
+            for keyword, pattern_masks in keyword_matchers:
+                # 长度差是编辑距离的下界，不可能更优时跳过计算
+                if meme_min is not None and abs(tag_len - len(keyword)) >= meme_min:
+                    continue
+                if pattern_masks is not None:
+                    distance = _levenshtein_myers(pattern_masks, len(keyword), tag)
+                else:
+                    distance = _levenshtein_distance(tag, keyword)
+                if meme_min is None or distance < meme_min:
+                    meme_min = distance
+                    if meme_min == 0:
+                        break
+            if meme_min == 0:
+                break
+        if meme_min is None:
+            continue
+        meme_scores.append((meme, meme_min))
+        if min_distance is None or meme_min < min_distance:
+            min_distance = meme_min
     t2 = time_ns()
     logger.debug(f"编辑距离查询耗时: {(t2 - t1) / 1_000_000} ms")
 
-    # 按照编辑距离排序
-    meme_scores.sort(key=lambda x: x[1])
-
     # 随机从编辑距离最小的 Meme 中抽取一个
-    min_distance = meme_scores[0][1]
     candidates = [meme for meme, distance in meme_scores if distance == min_distance]
     selected_meme = random.choice(candidates) if candidates else None
 
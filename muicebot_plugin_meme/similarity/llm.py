@@ -9,7 +9,17 @@ from nonebot import logger
 from ..config import config
 from ..models import Meme
 
-system_template = """你现在正在参与一段社交媒体对话，你的设定如下:
+# 模块级预编译的数字提取正则
+_DIGIT_RE = re.compile(r"\d+")
+
+
+def _build_system(system_prompt: str, user_message: str, ai_response: str) -> str:
+    """
+    构建检索请求的系统提示词
+
+    f-string 在解析期拼接，省去 str.format 每次调用的格式串解析
+    """
+    return f"""你现在正在参与一段社交媒体对话，你的设定如下:
 “{system_prompt}”
 ---
 用户发来了以下信息:
@@ -27,10 +37,12 @@ def _generate_prompt(memes: list[Meme]) -> str:
     """
     生成查询提示词
     """
-    memes_info = [
-        f"id: {meme.id}, tags: {meme.tags}, desc: {meme.description};" for meme in memes
-    ]
-    return "\n".join(memes_info)
+    # 单缓冲追加后一次 join，避免 N 个中间行字符串再整体拼接
+    buf: list[str] = []
+    append = buf.append
+    for meme in memes:
+        append(f"id: {meme.id}, tags: {meme.tags}, desc: {meme.description};\n")
+    return "".join(buf)
 
 
 async def llm_query(message: Message, memes: list[Meme]) -> int:
@@ -56,9 +68,7 @@ async def llm_query(message: Message, memes: list[Meme]) -> int:
     else:
         system_prompt = "无"
 
-    system = system_template.format(
-        system_prompt=system_prompt, user_message=user_message, ai_response=ai_response
-    )
+    system = _build_system(system_prompt, user_message, ai_response)
     prompt = _generate_prompt(
         memes[: min((config.meme_general_max_query, config.meme_llm_max_query))]
     )
@@ -87,10 +97,10 @@ async def llm_query(message: Message, memes: list[Meme]) -> int:
     logger.debug(f"LLM 请求已完成，用量: {response_usage}")
 
     try:
-        target_meme_id = int(response_text)
+        target_meme_id = int(response_text.strip())
     except ValueError:
         logger.warning(f"LLM 返回了预期之外的回复: {response_text}, 正在尝试提取数字")
-        match = re.search(r"\d+", response_text)
+        match = _DIGIT_RE.search(response_text)
         if match:
             target_meme_id = int(match.group())
         else:
@@ -11,6 +11,9 @@ from nonebot.adapters import Event
 from nonebot_plugin_alconna import UniMessage, uniseg
 from PIL import Image, ImageSequence
 
+# 模块级预编译，避免热路径上的每次编译/缓存查找
+_THINK_RE = re.compile(r"<think>(.*?)</think>", re.DOTALL)
+
 
 async def extract_multi_resource(
     message: UniMessage, type: Literal["audio", "image", "video", "file"], event: Event
@@ -34,7 +37,7 @@ async def extract_multi_resource(
                 )
             elif resource.origin is not None:
                 logger.warning("无法通过通用方式获取文件URL，回退至适配器自有方式...")
-                path = await get_file_via_adapter(resource.origin, event)  # type:ignore
+                path = await get_file_via_adapter(resource.origin, event)  # type: ignore
             else:
                 continue
 
@@ -53,10 +56,7 @@ def process_message(message: str) -> str:
     if not message.startswith("<think>"):
         return message
 
-    thoughts_pattern = re.compile(r"<think>(.*?)</think>", re.DOTALL)
-    result = thoughts_pattern.sub("", message).strip()
-
-    return result
+    return _THINK_RE.sub("", message).strip()
 
 
 def extract_and_combine_gif_frames(
@@ -73,19 +73,13 @@ def extract_and_combine_gif_frames(
         gif_path = BytesIO(gif_path)
     gif = Image.open(gif_path)
 
-    # 提取间隔帧
-    frames = [
-        frame.copy().convert("RGBA")
-        for i, frame in enumerate(ImageSequence.Iterator(gif))
-        if i % step == 0
-    ]
+    # 利用 n_frames 预先确定画布尺寸，逐帧粘贴而不保留中间帧列表
+    frame_count = math.ceil(getattr(gif, "n_frames", 1) / step)
 
-    if not frames:
+    if frame_count <= 0:
         raise ValueError("没有提取到任何帧，请检查 step 参数是否过大。")
 
-    # 获取帧尺寸
-    frame_count = len(frames)
-    width, height = frames[0].size
+    width, height = gif.size
 
     cols = math.ceil(math.sqrt(frame_count))
     rows = math.ceil(frame_count / cols)
@@ -94,17 +88,20 @@ def extract_and_combine_gif_frames(
     out_width = cols * width
     out_height = rows * height
 
-    combined_image = Image.new("RGBA", (out_width, out_height))
+    # 无透明通道的 GIF 用 RGB 画布，像素量少 1/4
+    mode = "RGBA" if "transparency" in gif.info else "RGB"
+    combined_image = Image.new(mode, (out_width, out_height))
 
-    for idx, frame in enumerate(frames):
-        row = idx // cols
-        col = idx % cols
-        x = col * width
-        y = row * height
-        combined_image.paste(frame, (x, y))
+    idx = 0
+    for i, frame in enumerate(ImageSequence.Iterator(gif)):
+        if i % step != 0:
+            continue
+        row, col = divmod(idx, cols)
+        combined_image.paste(frame.convert(mode), (col * width, row * height))
+        idx += 1
 
-    # 保存合成图像
+    # 保存合成图像；仅供 LLM 审查的临时图，取最低压缩级别换取编码速度
     image_bytes = BytesIO()
-    combined_image.save(image_bytes, format="PNG")
+    combined_image.save(image_bytes, format="PNG", compress_level=1)
     image_bytes.seek(0)
     return image_bytes